@@ -7,9 +7,18 @@
 # include directory generation based on parsing the file for #include
 
 import sys, getopt, time, os, re
+import operator
+import bisect
+import functools
+import io
+import mmap
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import chain
+import pickle
 from difflib import SequenceMatcher
 from enum import Enum
-import glob
+import fnmatch
 from os.path import join as pjoin
 
 ########################################################################################################################
@@ -36,6 +45,13 @@ more_newlines = 1
 working_directory = "."
 # these directories will be excluded when searching for Makefile.am's (or any other processing). -e is the argument
 exclude_directories = []
+# how many processes render the per-library CMake content. -j switch, 1 keeps everything in this process
+jobs = 1
+# the same directories normalized and suffixed with the path separator, ready to be fed to
+# str.startswith. Set after command line parsing
+exclude_prefixes = ()
+# the normalized excluded directories themselves, so the directory proper is caught too
+exclude_normalized = frozenset()
 
 ########################################################################################################################
 #                                       The application logic structures                                               #
@@ -43,18 +59,20 @@ exclude_directories = []
 
 # the list of libraries that will be built. contains Library objects
 libraries = []
+# the same Library objects indexed by their canonic name, for O(1) lookups
+libraries_by_canonic = {}
 # will contain all the options that were gathered from configure.ac in form of Option objects
 options = {}
-# will contain all the defines from the configure.ac
+# will contain all the defines from the configure.ac as TempDefine objects, keyed by the define name
 temp_defines = {}
 # will contain the CMakeLists of the converted system. Key is the directory
 cmake_files = {}
-# will contain all the variables defined in configure.ac
+# will contain all the variables defined in configure.ac. Key is the name, value the list of assigned values
 config_ac_variables = {}
 # will hold extra content for CMakeLists in specific directories
 extra_content = {}
-# The list of all the directories that will need a CMakeLists.txt in them
-required_directories = []
+# The set of all the directories that will need a CMakeLists.txt in them
+required_directories = set()
 
 ########################################################################################################################
 # Constants
@@ -63,6 +81,73 @@ cpp_extensions = [".c", ".cpp", ".cxx", ".c++", ".cc"]
 header_extensions = [".h", ".hpp", ".hxx", ".h++", ".hh"]
 qrc_extensions = [".qrc"]
 
+# maps each known extension to the bucket the source tree walker sorts it into
+_EXT_BUCKET = {}
+for _ext in cpp_extensions:
+    _EXT_BUCKET[_ext] = 0
+for _ext in header_extensions:
+    _EXT_BUCKET[_ext] = 1
+for _ext in qrc_extensions:
+    _EXT_BUCKET[_ext] = 2
+
+# precompiled patterns matching the pieces of the configure.ac macros the script understands. Parsing with these
+# is done in one C-level scan per line instead of walking the characters one by one in python
+_AC_ARG_NAME_RE = re.compile(r"AC_ARG_ENABLE\(\s*([^,]+)")
+_AC_ARG_DESC_RE = re.compile(r"\[\s*\S+\s+([^\]]*)\]")
+_AC_COND_NAME_RE = re.compile(r"AM_CONDITIONAL\(\s*([^,]+)")
+_AC_COND_VAR_RE = re.compile(r"\$([^\"\s=]*)")
+_AC_DEFINE_RE = re.compile(r"AC_DEFINE\(\s*\[?([^,\]]+)\]?\s*(?:,\s*(\[[^\]]*\]|[^,)]*)\s*)?(?:,\s*(\[[^\]]*\]|[^,)]*))?")
+_AC_DEFINE_VAR_RE = re.compile(r"\$([^\"]*)")
+
+# finds the start of every processable macro in configure.ac in one sweep over the whole text
+_AC_MACRO_RE = re.compile(r"^[ \t]*(AC_ARG_ENABLE|AM_CONDITIONAL|AC_DEFINE|AC_CONFIG_FILES)\(", re.M)
+
+# classifies the left-hand side of a Makefile.am assignment in a single scan
+_LHS_RE = re.compile(r"(.+?)_(LIBRARIES|PROGRAMS|SOURCES|LDADD|LDFLAGS|C(?:XX|PP)?FLAGS)$")
+
+# an automake "if CONDITION" line. Anchored on the whitespace so ifeq/ifdef and friends don't match
+_IF_RE = re.compile(r"^if\s+(\S+)")
+
+# extracts the $(variable) references from a value
+_VAR_RE = re.compile(r"\$\(([^)]+)\)")
+
+# a plain variable definition in configure.ac, capturing the name and the value
+_VAR_ASSIGN_RE = re.compile(r"([A-Za-z][A-Za-z0-9_]*)\s*=(.*)$")
+
+# matches an include directory flag and captures the directory itself
+_INCLUDE_RE = re.compile(r"^-I(.+)$")
+
+# splits a library file name like libfoo.a into the name the targets refer to and the extension
+_LIB_STRIP_RE = re.compile(r"^lib(.*?)\.(a|so|la|dylib)$")
+
+# directories never worth descending into when walking a source tree
+_SKIP_DIRS = (".git", ".svn", ".hg", "node_modules", "__pycache__")
+
+# translation table turning everything except letters, numbers and the underscore into an underscore
+_CANON_TABLE = {c: (chr(c) if chr(c).isdigit() or chr(c).isalpha() or chr(c) == '_' else '_') for c in range(256)}
+
+# deletion tables for the various cleanup spots, each replaces a chain of str.replace calls with one scan
+_GARBAGE_DEL = str.maketrans('', '', '][,$()')
+_BRACKET_COMMA_DEL = str.maketrans('', '', '][,')
+_BRACKET_DEL = str.maketrans('', '', '][')
+_PAREN_DOLLAR_DEL = str.maketrans('', '', '$()')
+_DASH_TO_UNDERSCORE = str.maketrans('-', '_')
+
+# the fixed blocks of the top level CMakeLists.txt in a commented and a bare variant. The one matching
+# the -c setting is picked once, nothing branches on generate_comments per line anymore
+_CONFIG_H_BLOCK = ("set(CONFIG_H ${CMAKE_BINARY_DIR}/config.h)\n"
+                   "string(TIMESTAMP CURRENT_TIMESTAMP)\n"
+                   "file(WRITE ${CONFIG_H} \"/* WARNING: This file is auto-generated by CMake on ${CURRENT_TIMESTAMP}"
+                   ". DO NOT EDIT!!! */\\n\\n\")\n")
+_CONFIG_H_BLOCK_COMMENTED = ("# The lines below will generate the config.h based on the options above\n"
+                             "# The file will be in the ${CMAKE_BINARY_DIR} location\n" + _CONFIG_H_BLOCK)
+_TOP_TAIL = ("\ninclude_directories( ${CMAKE_BINARY_DIR} )\n"
+             "add_definitions( \"-DHAVE_CONFIG_H\" )")
+_TOP_TAIL_COMMENTED = ("\n# Setting the include directory for the application to find config.h\n"
+                       "include_directories( ${CMAKE_BINARY_DIR} )\n"
+                       "# Since we have created a config.h add a global define for it\n"
+                       "add_definitions( \"-DHAVE_CONFIG_H\" )")
+
 ########################################################################################################################
 #                                       Classes used by the application                                                #
 ########################################################################################################################
@@ -71,8 +156,11 @@ qrc_extensions = [".qrc"]
 # represents a cmake file that will be generated at a later stage
 ########################################################################################################################
 class CMakeFile:
+
+    __slots__ = ('directory', 'contained_libraries_content', 'libraries', 'extra_content')
+
     def __init__(self, directory):
-        self.directory = directory                  # The directory where this can be found
+        self.directory = sys.intern(directory)      # The directory where this can be found
         self.contained_libraries_content = []       # All the content of the libraries that are created in here
         self.libraries = []                         # All the libraries that are created by this file
         self.extra_content = ""                     # Extra stuff such as add_subdriectory
@@ -88,6 +176,11 @@ class TargetType(Enum):
 # represents a library that will be built by a specific make command
 ########################################################################################################################
 class Library:
+
+    __slots__ = ('name', 'dependant', 'filelist', 'condition', 'link_with_libs', 'compiler_flags', 'linker_flags',
+                 'conditional_appends', 'just_variables', 'added_subdirectories', 'target_type', 'ttype',
+                 'referred_name', 'canonic_name', 'directory', 'type')
+
     def __init__(self, name, directory):
         self.name = name
         self.dependant = False
@@ -104,23 +197,21 @@ class Library:
         self.referred_name = name
 
         if '$' in self.name:
-            self.name = self.name.replace('$', '')
-            self.name = self.name.replace('(', '')
-            self.name = self.name.replace(')', '')
+            self.name = self.name.translate(_PAREN_DOLLAR_DEL)
             self.dependant = True
 
         self.canonic_name = canonicalize(self.name)
-        self.directory = directory
+        # interned, the same directory is referenced by every library built in it
+        self.directory = sys.intern(directory)
 
         if not self.dependant:
-            if self.name.endswith(".a"):
-                self.type = "STATIC"
-                self.referred_name = self.name[3:]
-                self.referred_name = self.referred_name[:-2]
+            m = _LIB_STRIP_RE.match(self.name)
+            if m:
+                self.type = "STATIC" if m.group(2) == "a" else "DYNAMIC"
+                self.referred_name = m.group(1)
             else:
                 self.type = "DYNAMIC"
-                self.referred_name = self.name[3:]
-                self.referred_name = self.referred_name[:-3]
+                self.referred_name = self.name
         else:
             self.type = "STATIC"
             self.referred_name = self.name
@@ -131,61 +222,18 @@ class Library:
 ########################################################################################################################
 class Option:
 
+    __slots__ = ('name', 'description', 'status', 'define', 'define_value', 'define_description', 'extra_defines')
+
     def __init__(self, name, description, status, define, define_value, define_description):
-        name = name.replace("-", "_")
-        if upcase_identifiers:
-            self.name = name.upper()
-        else:
-            self.name = name
+        name = name.translate(_DASH_TO_UNDERSCORE)
+        self.name = name.upper() if upcase_identifiers else name
         self.description = description
         self.status = status
         self.define = define
-        define_value = define_value.replace(']', '')
-        define_value = define_value.replace(',', '')
-        define_value = define_value.replace('[', '')
-        self.define_value = define_value
+        self.define_value = define_value.translate(_BRACKET_COMMA_DEL)
         self.define_description = define_description
         self.extra_defines = []
 
-    def set_name(self, name):
-        self.name = name
-
-    def get_name(self):
-        return self.name
-
-    def set_description(self, description):
-        self.description = description
-
-    def get_description(self):
-        return self.description
-
-    def set_status(self, status):
-        self.status = status
-
-    def get_status(self):
-        return self.status
-
-    def set_define(self, define):
-        self.define = define
-
-    def get_define(self):
-        return self.define
-
-    def set_define_value(self, define_value):
-        if '[' in define_value:
-            define_value = define_value.replace(']', '')
-            define_value = define_value.replace('[', '')
-        self.define_value = define_value
-
-    def get_define_value(self):
-        return self.define_value
-
-    def set_define_description(self, define_description):
-        self.define_description = define_description
-
-    def get_define_description(self):
-        return self.define_description
-
     def finalize(self):
         if len(self.description) <= 1:
             self.description = "Enable " + self.name
@@ -194,12 +242,20 @@ class Option:
         if len(self.define_description) <= 1:
             self.define_description = self.description
 
-    def add_extra_define(self, extra_define):
-        self.extra_defines.append(extra_define)
 
-    def get_extra_defines(self):
-        return self.extra_defines
+########################################################################################################################
+# a define picked up from configure.ac that is not yet bound to an option
+########################################################################################################################
+class TempDefine:
 
+    __slots__ = ('name', 'option_name', 'description', 'value', 'used')
+
+    def __init__(self, name, option_name, description, value):
+        self.name = name
+        self.option_name = option_name
+        self.description = description
+        self.value = value
+        self.used = 0
 
 
 ########################################################################################################################
@@ -216,22 +272,24 @@ def warning(*s):
 # Checks if there is already a library called
 ########################################################################################################################
 def has_library(name):
-    for l in libraries:
-        if l.canonic_name == name:
-            return True
-    return False
+    return name in libraries_by_canonic
 
 ########################################################################################################################
-# counts the parentheses in the line. Returns 0 if the number of opened parenthesis equals the number of closed ones
+# returns the index just past the parenthesis closing the already opened one at start
 ########################################################################################################################
-def count_parentheses(line):
-    parco = 0
-    for char in line:
-        if char == '(':
-            parco += 1
-        if char == ')':
-            parco -= 1
-    return parco
+def find_balanced_end(text, start):
+    depth = 1
+    i = start
+    n = len(text)
+    while i < n:
+        close_pos = text.find(')', i)
+        if close_pos == -1:
+            return n
+        depth += text.count('(', i, close_pos) - 1
+        i = close_pos + 1
+        if depth == 0:
+            return i
+    return n
 
 
 ########################################################################################################################
@@ -243,98 +301,113 @@ def replace_quotes(a):
 
 
 def get_library_for_name(name):
-    for l in libraries:
-        if l.canonic_name == name:
-            return l
-    return None
+    return libraries_by_canonic.get(name)
 
 ########################################################################################################################
 # returns the similarity of two strings.
 ########################################################################################################################
+@functools.lru_cache(maxsize=8192)
+def _similar_cached(a, b):
+    # wildly different lengths can never be similar, skip the expensive matcher for those
+    if abs(len(a) - len(b)) > max(len(a), len(b)) * 0.6:
+        return 0.0
+    sm = SequenceMatcher(None, a, b, autojunk=False)
+    # quick_ratio is a cheap upper bound of ratio, good enough to rule out dissimilar pairs
+    upper = sm.quick_ratio()
+    if upper <= 0.5:
+        return upper
+    return sm.ratio()
+
+
 def similar(a, b):
-    return SequenceMatcher(None, a, b).ratio()
+    return _similar_cached(a, b) if a <= b else _similar_cached(b, a)
 
 
 ########################################################################################################################
 # Whether the directory is ecluded or not
 ########################################################################################################################
+@functools.lru_cache(maxsize=None)
 def should_exclude(dire):
-    for exc_dir in exclude_directories:
-        if dire.startswith(exc_dir):
-            return True
-    return False
+    normalized = os.path.normpath(dire)
+    return normalized in exclude_normalized or normalized.startswith(exclude_prefixes)
 
 ########################################################################################################################
 # removes the garbage characters from the given string
 ########################################################################################################################
 def remove_garbage(extra_value):
-    extra_value = extra_value.replace(']', '')
-    extra_value = extra_value.replace(',', '')
-    extra_value = extra_value.replace('[', '')
-    extra_value = extra_value.replace('$', '')
-    extra_value = extra_value.replace('(', '')
-    extra_value = extra_value.replace(')', '')
-    extra_value = extra_value.strip()
-    return extra_value
+    return extra_value.translate(_GARBAGE_DEL).strip()
 
 
 ########################################################################################################################
 # All characters in the name except for letters, numbers, the strudel (@), and the underscore are turned into underscores
 ########################################################################################################################
 def canonicalize(a):
-    canonic_name = ""
-    for c in a:
-        if c.isdigit() or c.isalpha() or c =='_':
-            canonic_name += c
-        else:
-            canonic_name += "_"
-    return canonic_name
+    if a.isascii():
+        return a.translate(_CANON_TABLE)
+    # the table only covers the first 256 code points and translate passes unmapped ones through,
+    # so anything beyond it falls back to the per-character rule
+    return ''.join(c if c.isdigit() or c.isalpha() or c == '_' else '_' for c in a)
+
+
+########################################################################################################################
+# Walks the files below the given path with os.scandir. Excluded directories are pruned before descending into
+# them, so their entries are never even stated. The files of a directory are yielded before its subdirectories
+########################################################################################################################
+def _walk_files(path):
+    try:
+        entries = os.scandir(path)
+    except OSError:
+        return
+    with entries:
+        subdirs = []
+        for entry in entries:
+            # is_dir uses the d_type cached by readdir, no extra stat call here
+            if entry.is_dir(follow_symlinks=False):
+                if not should_exclude(entry.path):
+                    subdirs.append(entry)
+            else:
+                yield entry
+    # descend in inode order, neighbouring inodes tend to sit close together on disk so the
+    # traversal seeks less on rotational media. inode() reads the number readdir already delivered
+    subdirs.sort(key=lambda e: e.inode())
+    for entry in subdirs:
+        yield from _walk_files(entry.path)
 
 
 ########################################################################################################################
 # Finds a file with the given name
 ########################################################################################################################
+
+# filename -> full path indexes of the already walked trees, so repeated find_file calls don't walk the tree again
+_find_file_cache = {}
+
 def find_file(name, path):
-    for root, dirs, files in os.walk(path):
-        if name in files:
-            return os.path.join(root, name)
+    index = _find_file_cache.get(path)
+    if index is None:
+        index = {}
+        for entry in _walk_files(path):
+            if entry.name not in index:
+                index[entry.name] = entry.path
+        _find_file_cache[path] = index
+    return index.get(name)
 
 
 ########################################################################################################################
 # processes the given AC_ARG_ENABLE and creates an entry in the global options
 ########################################################################################################################
 def process_argument(line):
-    s = line[len("AC_ARG_ENABLE("):].strip()
-    # fetch the name of the argument
-    arg_name = ""
-    for c in s:
-        if c == ',':
-            break
-        arg_name += c
-    # fetch the description of the argument
-    description = ""
-    for i in range(len(s)):
-        if s[i] == '[':
-            # after the [ come spaces
-            i += 1
-            while s[i] == ' ' and i < len(s):
-                i += 1
-            # then comes the option names, skip that
-            while s[i] != ' ' and i < len(s):
-                i += 1
-            # and then again a lot of spaces
-            while s[i] == ' ' and i < len(s):
-                i += 1
-            # then finally the description, till the closing ]
-            while s[i] != ']' and i < len(s):
-                description += s[i]
-                i += 1
-            # we have the description, just break out from here
-            break
+    m = _AC_ARG_NAME_RE.match(line)
+    if not m:
+        return
+    # the name of the argument
+    arg_name = m.group(1).strip()
+    # the description lives in the first [ ... ] block, right after the option name
+    dm = _AC_ARG_DESC_RE.search(line)
+    description = dm.group(1) if dm else ""
 
     # now see if this is on or off
     on_off = "OFF"
-    if "=yes" in s:
+    if "=yes" in line:
         on_off = "ON"
 
     arg_name = arg_name.replace("-", "_")
@@ -343,46 +416,27 @@ def process_argument(line):
     if not (arg_name in options):
         options[arg_name] = Option(arg_name, description, on_off, "", "", "")
     else:
-        options[arg_name].set_name(arg_name)
-        options[arg_name].set_description(description)
-        options[arg_name].set_status(on_off)
-
-
-########################################################################################################################
-# Checks whether this line os processable by the script or not
-########################################################################################################################
-def processable_line(line):
-    possible_starts = ["AC_ARG_ENABLE(", "AM_CONDITIONAL(", "AC_DEFINE(", "AC_CONFIG_FILES("]
-    for start in possible_starts:
-        if line.startswith(start):
-            return start[:-1]
-    return ""
+        options[arg_name].name = arg_name
+        options[arg_name].description = description
+        options[arg_name].status = on_off
 
 
 ########################################################################################################################
 # processes the AM_CONDITIONAL lines
 ########################################################################################################################
 def process_conditional(line):
-    s = line[len("AM_CONDITIONAL("):].strip()
-    define_name = ""
-    for c in s:
-        if c == ',':
-            break
-        define_name += c
-    bound_option = ""
-    stage = 1  # 1 - skipping, 2 - adding
-    for c in s:
-        if (c == '"' or c == ' ' or c == '=') and stage == 2:
-            break
-        if stage == 2:
-            bound_option += c
-        if c == '$':
-            stage = 2
+    m = _AC_COND_NAME_RE.match(line)
+    if not m:
+        return
+    define_name = m.group(1).strip()
+    # the option bound to this conditional is the first $variable reference
+    vm = _AC_COND_VAR_RE.search(line)
+    bound_option = vm.group(1) if vm else ""
 
     bound_option = bound_option.replace("-", "_")
 
     if bound_option in options:
-        options[bound_option].set_define(define_name)
+        options[bound_option].define = define_name
     else:
         options[bound_option] = Option(bound_option, "", "", define_name, "", "")
 
@@ -390,56 +444,82 @@ def process_conditional(line):
 # this will process the defines from the configure.ac, but puts them in a separate list, with the comments
 ########################################################################################################################
 def process_a_define(line):
-    s = line[len("AC_DEFINE("):].strip()
-    # now parse out the define data from s
-
-    define_string = ""
-    defined_to_value = ""
-    define_description = ""
-
-    stage = 1  # 1 - parsing  the define name, 2 parsing the define value, 3 - parsing the define description
-    sqp = 0
-    roup = 1
-    for c in s:
-        if c == '[':
-            sqp += 1
-        if c == ']':
-            sqp -= 1
-        if c == '(':
-            roup += 1
-        if c == ')':
-            roup -= 1
-            # Did we close the parentheses for AC_DEFINE( ?
-            if roup == 0:
-                break
-        if c == ',' and sqp == 0:
-            stage += 1
-            if stage == 4:
-                break
-        if stage == 1 and c != ',':
-            define_string += c
-        elif stage == 2 and c != ',':
-            defined_to_value += c
-        elif stage == 3:
-            define_description += c
-
-    # and finding the variable name (option name in later stages here)
-    variable_name = ""
-    stage = 1 # 1 - skipping, 2 - adding
-    for c in s:
-        if c == '"' and stage == 2:
-            break
-        if stage == 2:
-            variable_name += c
-        if c == '$':
-            stage = 2
+    m = _AC_DEFINE_RE.match(line)
+    if not m:
+        return
+    define_string = m.group(1).strip()
+    defined_to_value = m.group(2) or ""
+    define_description = m.group(3) or ""
+
+    # and finding the variable name (option name in later stages here). It is the first $variable reference, which
+    # usually comes from the "if" line kept together with the AC_DEFINE by process_configure_ac
+    vm = _AC_DEFINE_VAR_RE.search(line)
+    variable_name = vm.group(1) if vm else ""
 
-    temp_defines[define_string] = {}
-    temp_defines[define_string]["name"] = define_string
-    temp_defines[define_string]["option_name"] = variable_name.upper()
-    temp_defines[define_string]["description"] = define_description
-    temp_defines[define_string]["value"] = defined_to_value
-    temp_defines[define_string]["used"] = 0
+    temp_defines[define_string] = TempDefine(define_string, variable_name.upper(), define_description, defined_to_value)
+
+
+########################################################################################################################
+# A cache of already parsed Makefile.am files so repeated conversion runs only re-parse what actually changed.
+# Keyed by (path, mtime, size), the value holds the global state deltas the parse produced. The parse honours
+# the -e exclusions, so the cache file also records the exclude settings it was built with and is thrown away
+# when they differ. A library fed from several Makefile.am files (a += in another directory) cannot be replayed
+# from per-file entries at all, the involved directories are dropped from the cache instead. Loaded lazily,
+# written back at the end of a conversion
+########################################################################################################################
+_makefile_am_cache = None
+_makefile_am_cache_dirty = False
+# directories whose Makefile.am parses touched a library declared elsewhere, their entries must not be kept
+_makefile_am_uncacheable_dirs = set()
+# bumped whenever the entries of older versions could replay wrong state
+_MAKEFILE_AM_CACHE_FORMAT = 2
+
+
+def _makefile_am_cache_file():
+    return pjoin(working_directory, ".autocmake_cache", "makefile_am.pickle")
+
+
+def _exclude_signature():
+    return tuple(sorted(exclude_normalized))
+
+
+def _load_makefile_am_cache():
+    global _makefile_am_cache
+    try:
+        with open(_makefile_am_cache_file(), "rb") as f:
+            cache_format, cached_excludes, _makefile_am_cache = pickle.load(f)
+        # a cache built by another version or with other exclusions would replay wrong content right back
+        if cache_format != _MAKEFILE_AM_CACHE_FORMAT or cached_excludes != _exclude_signature():
+            _makefile_am_cache = {}
+    except (OSError, pickle.PickleError, EOFError, TypeError, ValueError):
+        _makefile_am_cache = {}
+
+
+def _save_makefile_am_cache():
+    if not (_makefile_am_cache_dirty or _makefile_am_uncacheable_dirs):
+        return
+    # entries of the cross-file-feeding directories would replay incomplete or doubled library state,
+    # drop them so those files are always parsed fresh
+    for key in [k for k in _makefile_am_cache if os.path.dirname(k[0]) in _makefile_am_uncacheable_dirs]:
+        del _makefile_am_cache[key]
+    try:
+        os.makedirs(os.path.dirname(_makefile_am_cache_file()), exist_ok=True)
+        with open(_makefile_am_cache_file(), "wb") as f:
+            pickle.dump((_MAKEFILE_AM_CACHE_FORMAT, _exclude_signature(), _makefile_am_cache),
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        pass
+
+
+def _replay_makefile_am(cached):
+    cached_libraries, cached_directories, cached_extra, directory = cached
+    for library in cached_libraries:
+        if not has_library(library.canonic_name):
+            libraries.append(library)
+            libraries_by_canonic[library.canonic_name] = library
+    required_directories.update(cached_directories)
+    if cached_extra is not None:
+        extra_content[directory] = cached_extra
 
 
 ########################################################################################################################
@@ -457,23 +537,42 @@ def process_makefile_am(file):
     if should_exclude(current_directory):
         return
 
+    global _makefile_am_cache, _makefile_am_cache_dirty
+    if _makefile_am_cache is None:
+        _load_makefile_am_cache()
+
+    # an unchanged file was parsed by an earlier run already, just replay what it did
+    st = os.stat(file)
+    cache_key = (file, st.st_mtime_ns, st.st_size)
+    cached = _makefile_am_cache.get(cache_key)
+    if cached is not None:
+        _replay_makefile_am(cached)
+        return
+
+    libraries_before = len(libraries)
+
     # Will recurse into these dires
     dirs_to_go_in = []
 
     defined_variables = {}
-    libraries_in_this_file = []
+    libraries_in_this_file = set()
+    # read the whole file in one go and strip every physical line exactly once
     with open(file) as f:
-        content = f.readlines()
+        content = f.read().split('\n')
+    content = [line.strip() for line in content]
 
     # First run: parse out all the libraries
     for line in content:
-        line = line.strip()
         # is this a valid line? ie. no comments?
         if line.startswith("#"):
             continue
 
         # Yes, valid line
-        if line.find("_LIBRARIES") != -1 or line.find("_PROGRAMS") != -1:
+        eq = line.find('=')
+        if eq == -1:
+            continue
+        m = _LHS_RE.match(line[:eq].rstrip('+ \t'))
+        if m and m.group(2) in ("LIBRARIES", "PROGRAMS"):
             elements = line.split()
             library_names = elements[2:]
             makefiles_directory = current_directory
@@ -485,33 +584,39 @@ def process_makefile_am(file):
                 for library_name in library_names:
                     library = Library(library_name, makefiles_directory)
                     # program or library?
-                    if line.find("_PROGRAMS") != -1:
+                    if m.group(2) == "PROGRAMS":
                         library.target_type = TargetType.PROGRAM
                         library.referred_name = library.canonic_name
                     if not has_library(library.canonic_name):
                         libraries.append(library)
+                        libraries_by_canonic[library.canonic_name] = library
 
     # Next run: gather the source codes for all the libraries created in this file. Parse "if"'s also
     if_condition = ""
-    for i in range(len(content)):
-
-        line = content[i].strip()
+    i = 0
+    line_count = len(content)
+    while i < line_count:
+        line = content[i]
+        i += 1
         # is this a valid line? ie. no comments?
         if line.startswith("#"):
             continue
-        if line.startswith("if"):
-            elements = line.split()
-            if_condition = elements[1]
-        if line.startswith("endif"):
+        if_match = _IF_RE.match(line)
+        if if_match:
+            if_condition = if_match.group(1)
+        elif line.startswith("endif"):
             if_condition = ""
 
         # see if this is an assignment or not
         if '=' in line or "+=" in line:
             # simple assignment
-            # read in the line as long as we don't have ending \\
-            while line.endswith('\\'):
-                i += 1
-                line += content[i].strip()
+            # join up the continuation lines, each physical line is visited exactly once
+            if line.endswith('\\'):
+                joined = [line]
+                while joined[-1].endswith('\\') and i < line_count:
+                    joined.append(content[i])
+                    i += 1
+                line = ''.join(joined)
 
             line = line.replace("\\", "")
             line = ''.join('%-1s' % item for item in line.split('\t '))
@@ -523,17 +628,20 @@ def process_makefile_am(file):
             if '+' in variable:
                 variable = variable.replace('+', '').strip()
 
+            m = _LHS_RE.match(variable)
+            kind = m.group(2) if m else ""
+
             # see if this is a SOURCE identifier for a specific library
-            if variable.endswith("_SOURCES"):
+            if kind == "SOURCES":
                 # find the lib name
-                target_lib_name = variable[:-len("_SOURCES")]
+                target_lib_name = m.group(1)
 
                 # now find the library from the libraries list, built in the previous step
                 library = get_library_for_name(target_lib_name)
 
                 if library:
                     used = True
-                    libraries_in_this_file.append(target_lib_name)
+                    libraries_in_this_file.add(target_lib_name)
                     # do we have a condition for this library?
                     if if_condition:
                         library.condition += if_condition
@@ -543,14 +651,14 @@ def process_makefile_am(file):
                     else:
                         library.filelist = elements[1].split()
 
-            if variable.endswith("_LDADD"):
+            elif kind == "LDADD":
                 # find the lib name
-                target_lib_name = variable[:-len("_LDADD")]
+                target_lib_name = m.group(1)
                 library = get_library_for_name(target_lib_name)
 
-                if library in libraries:
+                if library:
                     used = True
-                    libraries_in_this_file.append(target_lib_name)
+                    libraries_in_this_file.add(target_lib_name)
                     # do we have a condition for this library?
                     if if_condition:
                         library.condition += if_condition
@@ -560,18 +668,15 @@ def process_makefile_am(file):
                     else:
                         library.link_with_libs = elements[1].split()
 
-            if variable.endswith("_CXXFLAGS") or variable.endswith("_CPPFLAGS") or variable.endswith("_CFLAGS"):
+            elif kind in ("CFLAGS", "CXXFLAGS", "CPPFLAGS"):
                 # find the lib name
-                if variable.endswith("_CFLAGS"):
-                    target_lib_name = variable[:-len("_CFLAGS")]
-                else:
-                    target_lib_name = variable[:-len("_CXXFLAGS")]
+                target_lib_name = m.group(1)
 
                 library = get_library_for_name(target_lib_name)
 
-                if library in libraries:
+                if library:
                     used = True
-                    libraries_in_this_file.append(target_lib_name)
+                    libraries_in_this_file.add(target_lib_name)
                     # do we have a condition for this library?
                     if if_condition:
                         library.condition += if_condition
@@ -583,14 +688,14 @@ def process_makefile_am(file):
                     else:
                         library.compiler_flags = defines
 
-            if variable.endswith("_LDFLAGS"):
+            elif kind == "LDFLAGS":
                 # find the lib name
-                target_lib_name = variable[:-len("_LDFLAGS")]
+                target_lib_name = m.group(1)
                 library = get_library_for_name(target_lib_name)
 
-                if library in libraries:
+                if library:
                     used = True
-                    libraries_in_this_file.append(target_lib_name)
+                    libraries_in_this_file.add(target_lib_name)
                     # do we have a condition for this library?
                     if if_condition:
                         library.condition += if_condition
@@ -604,7 +709,7 @@ def process_makefile_am(file):
                     dirs_to_go_in = elements[1]
                 # This is possibly just a "simple" variable. Highly possible just gathers
                 # stuff and uses it at a later stage with $(varname)
-                if variable.find("_LIBRARIES")  == -1 and variable.find("_PROGRAMS") == -1:
+                if kind not in ("LIBRARIES", "PROGRAMS"):
                     if not variable in defined_variables:
                         defined_variables[variable] = {}
                         defined_variables[variable]["value"] = []
@@ -620,261 +725,315 @@ def process_makefile_am(file):
 
     # firstly let's identify the conditional variables
     if defined_variables:
-        # go, through the defined variables see if we can replace any library.filelist element starting with $
-        for var_name in defined_variables:
-            for defined_lib_name in set(libraries_in_this_file):
-                found = False
-                library = get_library_for_name(defined_lib_name)
-
-                for file in library.filelist:
-                    inside_varname = "$(" + var_name + ")"
-                    if file.find(inside_varname) != -1:
-                        # Now, we have a list of #ifdef condition, append $source like stuff
-                        for cond, value in zip(defined_variables[var_name]["condition"], defined_variables[var_name]["value"]):
-                            cond_name = remove_garbage(cond)
-                            if cond_name in library.conditional_appends:
-                                library.conditional_appends[cond_name].append(' '.join(value))
-                            else:
-                                library.conditional_appends[cond_name] = value
-                            found = True
-                        break
-                if not found:
+        # gather the $(variable) references of every library's file list in one pass, then match the defined
+        # variables against that set instead of scanning every file for every variable
+        for defined_lib_name in libraries_in_this_file:
+            library = get_library_for_name(defined_lib_name)
+
+            referenced_vars = set()
+            for file in library.filelist:
+                referenced_vars.update(_VAR_RE.findall(file))
+
+            for var_name in defined_variables:
+                if var_name in referenced_vars:
+                    # Now, we have a list of #ifdef condition, append $source like stuff
+                    for cond, value in zip(defined_variables[var_name]["condition"], defined_variables[var_name]["value"]):
+                        cond_name = remove_garbage(cond)
+                        if cond_name in library.conditional_appends:
+                            library.conditional_appends[cond_name].append(' '.join(value))
+                        else:
+                            library.conditional_appends[cond_name] = value
+                else:
                     library.just_variables[var_name] = defined_variables[var_name]["value"]
 
+    added_directories = []
     if dirs_to_go_in:
         # These stuff will go in a directory -> add_subdirectory map above
-        extra_dir = ""
+        extra_parts = []
         for subdir in dirs_to_go_in.split():
             if not should_exclude(current_directory + "/" + subdir):
-                extra_dir += "\nadd_subdirectory( " + subdir + " )"
-                required_directories.append(current_directory + "/" + subdir)
-        extra_content[current_directory] = extra_dir
-
-
-########################################################################################################################
-# processes all the libraries, creates the requested CMakeFile list ofthe application
-########################################################################################################################
-def process_libraries():
-    for library in libraries:
-        current_content = ""
-        added_files = []
-        if generate_comments:
-            current_content += "# Generating the library " + library.name + "\n"
-        current_content += "set(project \"" + library.referred_name + "\")\n\n"
-        current_content += "set(${project}, \"\")\n"
-        condition_required = ""
-
-        # Here add the various conditional stuff for various files
-        for cond in library.conditional_appends:
-            conditional_append = library.conditional_appends[cond]
-            if cond:
-                # now find the condition from option, having define set to this "cond"
-                used_cond = False
-                for opt_name in options:
-                    option = options[opt_name]
-                    if option.get_define() == cond:
-                        used_cond = True
-                        # and of course parse out the "conditional_append" from the simple variables of the library
-                        # and generate cmake code which updates a list :)... also should be valid
-                        current_content += "\nif(" + option.get_name() + ")\n"
-                        unfolded_conditionals = ""
-                        condition_required = option.get_name()
-
-                        for cond_append in conditional_append:
-                            if '$' in cond_append:
-                                nice_var_name = remove_garbage(cond_append)
-                                if nice_var_name in library.just_variables:
-                                    l = [item for sublist in library.just_variables[nice_var_name] for item in sublist]
-                                    unfolded_conditionals = filelist_to_string(l, library.directory, 8)
-
-                        if unfolded_conditionals:
-                            current_content += "    list(APPEND ${project}_SOURCES" + unfolded_conditionals
-                            added_files.append(unfolded_conditionals)
-                        else:
-                            current_content += "    list(APPEND ${project}_SOURCES\n        " + "\n        ".join(conditional_append)
-                            added_files.append(conditional_append)
-
-                        current_content += "\n    )\nendif()\n"
-
-                if not used_cond:
-                    # We did not find this above, regardless generate an if() for it and a source of files
-                    condition_required = cond
-                    current_content += "\nif(" + cond + ")\n"
-                    current_content += "    list(APPEND ${project}_SOURCES\n        " + "\n        ".join(conditional_append)
-                    current_content += "\n    )\nendif()\n"
-
-            else:
-                add_regardless = []
+                extra_parts.append("\nadd_subdirectory( " + subdir + " )")
+                added_directories.append(current_directory + "/" + subdir)
+        extra_content[current_directory] = "".join(extra_parts)
+    required_directories.update(added_directories)
+
+    # a library touched here but declared by another Makefile.am cannot be replayed from either file's
+    # entry: this one only records new libraries, and the declaring one would bake the contribution in
+    for touched_name in libraries_in_this_file:
+        library = get_library_for_name(touched_name)
+        if library and library.directory != current_directory:
+            _makefile_am_uncacheable_dirs.add(library.directory)
+            _makefile_am_uncacheable_dirs.add(current_directory)
+
+    # remember what this file contributed for the next run
+    if current_directory not in _makefile_am_uncacheable_dirs:
+        _makefile_am_cache[cache_key] = (libraries[libraries_before:], added_directories,
+                                         extra_content.get(current_directory), current_directory)
+        _makefile_am_cache_dirty = True
+
+
+########################################################################################################################
+# Re-creates the globals _render_library reads inside a worker process. With the spawn or forkserver start
+# methods the workers import a fresh copy of the module, so the parsed state has to be handed over explicitly
+########################################################################################################################
+def _init_render_worker(parent_options, parent_variables, parent_comments):
+    global options, config_ac_variables, generate_comments
+    options = parent_options
+    config_ac_variables = parent_variables
+    generate_comments = parent_comments
+
+
+########################################################################################################################
+# renders the CMakeLists content of one library and tells which directory it belongs to
+########################################################################################################################
+def _render_library(library, define_to_option):
+    # hoist the attributes the loops below read over and over to locals
+    referred_name = library.referred_name
+    directory = library.directory
+    just_variables = library.just_variables
+    # the file list is handed to filelist_to_string up to once per matching option, sort it once here
+    filelist_sorted = sorted(library.filelist)
+    # the flattened value lists of just_variables, filled on first use
+    flat_just_vars = {}
+    # the fragments of the outgoing content, joined once at the end
+    parts = []
+    has_files = False
+    if generate_comments:
+        parts.append("# Generating the library " + library.name + "\n")
+    parts.append("set(project \"" + referred_name + "\")\n\n")
+    parts.append("set(${project}, \"\")\n")
+    condition_required = ""
+
+    # Here add the various conditional stuff for various files
+    for cond in library.conditional_appends:
+        conditional_append = library.conditional_appends[cond]
+        if cond:
+            # now find the condition from option, having define set to this "cond"
+            option = define_to_option.get(cond)
+            if option is not None:
+                # and of course parse out the "conditional_append" from the simple variables of the library
+                # and generate cmake code which updates a list :)... also should be valid
+                option_name = option.name
+                parts.append("\nif(" + option_name + ")\n")
                 unfolded_conditionals = ""
+                condition_required = option_name
+
                 for cond_append in conditional_append:
                     if '$' in cond_append:
                         nice_var_name = remove_garbage(cond_append)
-                        if nice_var_name in library.just_variables:
-                            l = [item for sublist in library.just_variables[nice_var_name] for item in sublist]
-                            unfolded_conditionals = filelist_to_string(l, library.directory, 8)
-                    else:
-                        add_regardless.append(cond_append)
-                unfolded_conditionals += filelist_to_string(add_regardless, library.directory, 8)
-                current_content += "list(APPEND ${project}_SOURCES" + unfolded_conditionals
-                added_files.append(unfolded_conditionals)
-                current_content += "\n)\n"
-
-        # Now match the option's define to the if_condition above
-        if library.condition:
-            condition_used = False
-            for option in options:
-                if options[option].get_define() == library.condition:
-                    # add an "if (option)" to the CMakeLists.txt
-                    current_content += "if (" + options[option].get_name() + ")\n"
-                    condition_required = options[option].get_name()
-                    # gather the list of files
-                    filelist = filelist_to_string(library.filelist, library.directory)
-                    current_content += "    list(APPEND ${project}_SOURCES\n    " + filelist + ")\nendif()\n\n"
-                    added_files.append(filelist)
-                    condition_used = True
-            if not condition_used:
-                new_condition = ""
-                for c in library.condition:
-                    new_condition += c
-                library.condition = new_condition
-                current_content += "if (" + new_condition + ")\n"
-                condition_required = new_condition
-                # gather the list of files
-                filelist = filelist_to_string(library.filelist, library.directory)
-                current_content += "    list(APPEND ${project}_SOURCES\n    " + filelist + ")\nendif()\n\n"
-                added_files.append(filelist)
+                        if nice_var_name in just_variables:
+                            l = flat_just_vars.get(nice_var_name)
+                            if l is None:
+                                l = list(chain.from_iterable(just_variables[nice_var_name]))
+                                flat_just_vars[nice_var_name] = l
+                            unfolded_conditionals = filelist_to_string(l, directory, 8)
+
+                if unfolded_conditionals:
+                    parts.append("    list(APPEND ${project}_SOURCES" + unfolded_conditionals)
+                    has_files = True
+                else:
+                    parts.append("    list(APPEND ${project}_SOURCES\n        " + "\n        ".join(conditional_append))
+                    has_files = True
 
-        else:
-            # gather the list of files
-            filelist = filelist_to_string(library.filelist, library.directory)
-            work_list = filelist.strip()
-            current_content += "list(APPEND ${project}_SOURCES\n    " + work_list + "\n)\n"
-            added_files.append(work_list)
+                parts.append("\n    )\nendif()\n")
 
-        if library.condition:
-            condition_required = library.condition
+            else:
+                # We did not find this above, regardless generate an if() for it and a source of files
+                condition_required = cond
+                parts.append("\nif(" + cond + ")\n")
+                parts.append("    list(APPEND ${project}_SOURCES\n        " + "\n        ".join(conditional_append))
+                parts.append("\n    )\nendif()\n")
 
-        if condition_required:
-            current_content += "if (" + condition_required + ")\n"
+        else:
+            add_regardless = []
+            unfolded_conditionals = ""
+            for cond_append in conditional_append:
+                if '$' in cond_append:
+                    nice_var_name = remove_garbage(cond_append)
+                    if nice_var_name in just_variables:
+                        l = flat_just_vars.get(nice_var_name)
+                        if l is None:
+                            l = list(chain.from_iterable(just_variables[nice_var_name]))
+                            flat_just_vars[nice_var_name] = l
+                        unfolded_conditionals = filelist_to_string(l, directory, 8)
+                else:
+                    add_regardless.append(cond_append)
+            unfolded_conditionals += filelist_to_string(add_regardless, directory, 8)
+            parts.append("list(APPEND ${project}_SOURCES" + unfolded_conditionals)
+            has_files = True
+            parts.append("\n)\n")
+
+    # Now match the option's define to the if_condition above
+    if library.condition:
+        condition_used = False
+        for option in options.values():
+            if option.define == library.condition:
+                # add an "if (option)" to the CMakeLists.txt
+                option_name = option.name
+                parts.append("if (" + option_name + ")\n")
+                condition_required = option_name
+                # gather the list of files
+                filelist = filelist_to_string(filelist_sorted, directory, pre_sorted = True)
+                parts.append("    list(APPEND ${project}_SOURCES\n    " + filelist + ")\nendif()\n\n")
+                has_files = True
+                condition_used = True
+        if not condition_used:
+            new_condition = "".join(library.condition)
+            library.condition = new_condition
+            parts.append("if (" + new_condition + ")\n")
+            condition_required = new_condition
+            # gather the list of files
+            filelist = filelist_to_string(filelist_sorted, directory, pre_sorted = True)
+            parts.append("    list(APPEND ${project}_SOURCES\n    " + filelist + ")\nendif()\n\n")
+            has_files = True
 
-        if library.target_type == TargetType.LIBRARY:
-            # and now add some stuff to create a library out of the current stuff
-            current_content += "add_library ( " +library.referred_name + \
-                               " " + library.type + " " +  "${${project}_SOURCES} )\n"
+    else:
+        # gather the list of files
+        filelist = filelist_to_string(filelist_sorted, directory, pre_sorted = True)
+        work_list = filelist.strip()
+        parts.append("list(APPEND ${project}_SOURCES\n    " + work_list + "\n)\n")
+        has_files = True
+
+    if library.condition:
+        condition_required = library.condition
+
+    if condition_required:
+        parts.append("if (" + condition_required + ")\n")
+
+    if library.target_type == TargetType.LIBRARY:
+        # and now add some stuff to create a library out of the current stuff
+        parts.append("add_library ( " + referred_name + " " + library.type +
+                     " " + "${${project}_SOURCES} )\n")
+    else:
+        parts.append("add_executable(" + library.name + " ${${project}_SOURCES} )\n")
+
+    if not has_files:
+        warning("No source files found for ", library.name )
+
+    # Now add the CPPFLAGS for the library
+    # Firstly: parse out the $ stuff, and find the corresponding values for them
+    strflags = library.compiler_flags
+    strflags = "".join(strflags)
+    flags = strflags.split()
+
+    final_flags = ""
+    to_work_with_flags = []
+    for flag in flags:
+        if not '$' in flag and not '@' in flag:
+            final_flags += replace_quotes(flag) + " "
         else:
-            current_content += "add_executable(" + library.name + " ${${project}_SOURCES} )\n"
-
-        if not added_files:
-            warning("No source files found for ", library.name )
-
-        # Now add the CPPFLAGS for the library
-        # Firstly: parse out the $ stuff, and find the corresponding values for them
-        strflags = library.compiler_flags
-        strflags = "".join(strflags)
-        flags = strflags.split()
-
-        final_flags = ""
-        to_work_with_flags = []
-        for flag in flags:
-            if not '$' in flag and not '@' in flag:
-                final_flags += replace_quotes(flag) + " "
+            to_work_with_flags.append(flag)
+
+    if final_flags:
+        parts.append("set_target_properties( " + referred_name + "\n"
+                     "    PROPERTIES COMPILE_FLAGS \"" + final_flags + "\"\n)")
+
+
+    final_flags = []
+    pending = deque(to_work_with_flags)
+    while pending:
+        flag = pending.popleft()
+        if '$' in flag:
+            m = _VAR_RE.search(flag)
+            if m:
+                desired_var = m.group(1)
+                if desired_var == "top_srcdir":
+                    pending.append("{CMAKE_SOURCE_DIR}")
+                elif desired_var in config_ac_variables:
+                    for v in config_ac_variables[desired_var]:
+                        final_flags.append(v)
+
+    include_directories = []
+    # Now walk through the to_work_with_flags and see if we have any include directories stuff
+    for flag in final_flags:
+        flag = flag.replace("'", "")
+        flag = flag.strip()
+
+        flags = flag.split()
+
+        for newflag in flags:
+            m = _INCLUDE_RE.match(newflag)
+            if m:
+                include_directories.append(m.group(1).replace("$(top_srcdir)", "${CMAKE_SOURCE_DIR}"))
+
+    if include_directories:
+        parts.append("\ntarget_include_directories( " + referred_name + " PRIVATE")
+        for i_d in include_directories:
+            parts.append("\n    " + i_d)
+        parts.append("\n)\n")
+
+    # See if we need to put in any target_link_libraries command
+    if library.link_with_libs:
+
+        final_link_list = "\ntarget_link_libraries( " + referred_name
+
+        for link_name in library.link_with_libs:
+            target_link_lib = make_nice_library_name(link_name)
+            if target_link_lib.startswith("$"):
+                # Find the just_variable for this target stuff, put it's value in here
+                clean_tll_name = remove_garbage(target_link_lib)
+                if clean_tll_name in just_variables:
+                    for more_link_names_list in just_variables[clean_tll_name]:
+                        for real_link in more_link_names_list:
+                            final_link_list += "\n    " + make_nice_library_name(real_link)
             else:
-                to_work_with_flags.append(flag)
-
-        if final_flags:
-            current_content += "set_target_properties( " + library.referred_name + "\n" \
-                               "    PROPERTIES COMPILE_FLAGS \"" \
-                               + final_flags + "\"\n)"
-
-
-        final_flags = []
-        done = False
-        while not done:
-            for flag in to_work_with_flags:
-                if '$' in flag:
-                    m = re.search("\$\(.*\)", flag)
-                    if m:
-                        desired_var = remove_garbage(m.group(0))
-                        if desired_var == "top_srcdir":
-                            to_work_with_flags.append("{CMAKE_SOURCE_DIR}")
-                        elif desired_var in config_ac_variables:
-                            for v in config_ac_variables[desired_var]["value"]:
-                                final_flags.append(v)
-
-                if flag in to_work_with_flags:
-                    to_work_with_flags.remove(flag)
-
-            # Are we done?
-            done = True
-            for flag in to_work_with_flags:
-                if '$' in flag:
-                    done = False
-
-        include_directories = []
-        # Now walk through the to_work_with_flags and see if we have any include directories stuff
-        for flag in final_flags:
-            flag = flag.replace("'", "")
-            flag = flag.strip()
-
-            flags = flag.split()
-
-            for newflag in flags:
-                if newflag.strip().startswith("-I"):
-                    include_directories.append(newflag.replace("$(top_srcdir)", "${CMAKE_SOURCE_DIR}"))
-
-        if include_directories:
-            current_content += "\ntarget_include_directories( " + library.referred_name + " PRIVATE"
-            for i_d in include_directories:
-                current_content += "\n    " + i_d.replace("-I", "")
-            current_content += "\n)\n"
-
-        # See if we need to put in any target_link_libraries command
-        if library.link_with_libs:
-
-            final_link_list = "\ntarget_link_libraries( " + library.referred_name
-
-            for link_name in library.link_with_libs:
-                target_link_lib = make_nice_library_name(link_name)
-                if target_link_lib.startswith("$"):
-                    # Find the just_variable for this target stuff, put it's value in here
-                    clean_tll_name = remove_garbage(target_link_lib)
-                    if clean_tll_name in library.just_variables:
-                        for more_link_names_list in library.just_variables[clean_tll_name]:
-                            for real_link in more_link_names_list:
-                                final_link_list += "\n    " + make_nice_library_name(real_link)
-                else:
-                    if target_link_lib.startswith("@"):
-                        # coming from configure.ac options
-                        canname = target_link_lib.replace("@", '')
-                        if canname in config_ac_variables:
-                            libs = config_ac_variables[canname]["value"]
-                            for lib in "".join(libs).split():
-                                link_lib_name = make_nice_library_name(lib)
-                                if not link_lib_name.startswith("-L"):
-                                    final_link_list += "\n    " + link_lib_name
-                        else:
-                            final_link_list += "\n#    " + target_link_lib + " # <-- FIX THIS"
-                            warning ("WARNING: ", target_link_lib, " in ", library.directory + "/CMakeLists.txt",
-                                   " was not indentifiable, fix it manually")
+                if target_link_lib.startswith("@"):
+                    # coming from configure.ac options
+                    canname = target_link_lib.replace("@", '')
+                    if canname in config_ac_variables:
+                        libs = config_ac_variables[canname]
+                        for lib in "".join(libs).split():
+                            link_lib_name = make_nice_library_name(lib)
+                            if not link_lib_name.startswith("-L"):
+                                final_link_list += "\n    " + link_lib_name
                     else:
-                        final_link_list += "\n    " + target_link_lib
-            final_link_list += "\n)\n"
+                        final_link_list += "\n#    " + target_link_lib + " # <-- FIX THIS"
+                        warning ("WARNING: ", target_link_lib, " in ", directory + "/CMakeLists.txt",
+                               " was not indentifiable, fix it manually")
+                else:
+                    final_link_list += "\n    " + target_link_lib
+        final_link_list += "\n)\n"
+
+        parts.append(final_link_list)
 
-            current_content += final_link_list
+    if condition_required:
+        parts.append("\nendif()\n")
 
-        if condition_required:
-            current_content += "\nendif()\n"
+    # And now put the CMakeLists to the given location
+    # f = open(directory + '/CMakeLists.txt','w')
+    # f.write(current_content)
+    # f.close()
 
-        # And now put the CMakeLists to the given location
-        # f = open(library.directory + '/CMakeLists.txt','w')
-        # f.write(current_content)
-        # f.close()
+    return directory, ''.join(parts)
+
+
+########################################################################################################################
+# processes all the libraries, creates the requested CMakeFile list ofthe application
+########################################################################################################################
+def process_libraries():
+    # index the options by their define once, the conditional lookups below become O(1)
+    define_to_option = {}
+    for opt in options.values():
+        if opt.define:
+            define_to_option[opt.define] = opt
+
+    # rendering a library only reads the shared state, so with -j the libraries can be spread over
+    # worker processes. The initializer ships that state over, the pool works with every start
+    # method, not just fork. The default stays in-process
+    if jobs > 1 and len(libraries) > 1:
+        render = functools.partial(_render_library, define_to_option=define_to_option)
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_render_worker,
+                                 initargs=(options, config_ac_variables, generate_comments)) as executor:
+            rendered = list(executor.map(render, libraries, chunksize=8))
+    else:
+        rendered = [_render_library(library, define_to_option) for library in libraries]
 
-        if not library.directory in cmake_files:
-            cmake_files[library.directory] = CMakeFile(library.directory)
+    for library, (directory, current_content) in zip(libraries, rendered):
+        if not directory in cmake_files:
+            cmake_files[directory] = CMakeFile(directory)
 
         # and fill it up
-        cmake_file_holder = cmake_files[library.directory]
+        cmake_file_holder = cmake_files[directory]
         cmake_file_holder.contained_libraries_content.append(current_content)
         cmake_file_holder.libraries.append(library)
 
@@ -900,18 +1059,27 @@ def make_nice_library_name(link_name):
     return target_link_lib
 
 
+########################################################################################################################
+# Whether the given path is a file. Cached, since the source tree does not change during a run and the same files are
+# checked again for every conditional append referring to them
+########################################################################################################################
+@functools.lru_cache(maxsize=None)
+def _exists(path):
+    return os.path.isfile(path)
+
 ########################################################################################################################
 # Transform a list (of files) to a string
 ########################################################################################################################
-def filelist_to_string(elements, source_directory, spacecount = 4):
-    filelist = ""
-    for file in sorted(elements):
-        if os.path.isfile(source_directory + "/" + file):
-            filelist += "\n" +" " * spacecount + "${CMAKE_CURRENT_SOURCE_DIR}/" + file
+def filelist_to_string(elements, source_directory, spacecount = 4, pre_sorted = False):
+    parts = []
+    spaces = " " * spacecount
+    for file in (elements if pre_sorted else sorted(elements)):
+        if _exists(source_directory + "/" + file):
+            parts.append("\n" + spaces + "${CMAKE_CURRENT_SOURCE_DIR}/" + file)
         else:
-            filelist += "\n#" +" " * spacecount + "${CMAKE_CURRENT_SOURCE_DIR}/" + file + " # File not found. Fix manually"
+            parts.append("\n#" + spaces + "${CMAKE_CURRENT_SOURCE_DIR}/" + file + " # File not found. Fix manually")
             warning("WARNING!!! The file: " + source_directory + "/" + file + " is present in the Makefile.am but cannot be found in the filesystem")
-    return filelist
+    return "".join(parts)
 
 ########################################################################################################################
 # processes the AC_CONFIG_FILES directive
@@ -931,120 +1099,135 @@ def process_config_files(line):
 ########################################################################################################################
 def process_configure_ac(fname):
     with open(fname) as f:
-        content = f.readlines()
+        text = f.read()
 
     function_list = {"AC_ARG_ENABLE": process_argument,
                      "AM_CONDITIONAL": process_conditional,
                      "AC_DEFINE": process_a_define,
                      "AC_CONFIG_FILES": process_config_files}
 
-    current_line = ""
-    previous_line = ""
-    line_distance = 0
-    for i in range(len(content)):
-        # This is horrible.... but I want to keep the line with the "if" before the AC_DEFINE since that is the one
-        # having the actual variable name, except for cases when not, so don't keep too old lines,
-        # funny results will come out of it.
-        if len(current_line) > 1 and '$' in current_line:
-            previous_line = current_line
-            line_distance = 0
-        else:
-            if line_distance < 3:
-                if '$' in current_line:
-                    previous_line = current_line
-                    line_distance = 0
-                else:
-                    line_distance += 1
-            else:
-                previous_line = ""
-                line_distance += 1
+    lines = text.split('\n')
 
-        current_line = content[i].strip()
+    # first sweep: pick up the plain variable definitions
+    for current_line in lines:
+        current_line = current_line.strip()
 
-        if current_line.startswith("#") or not current_line:
+        if not current_line or current_line[0] == '#':
             continue
 
         # see if this is a variable defintion or not
-        if '=' in current_line:
-            if current_line[0].isalpha():
-                # normal variable defintion, find the name
-                j = 0
-                varname = ""
-                while current_line[j].isalnum() or current_line[j] == '_':
-                    varname += current_line[j]
-                    j += 1
-                while current_line[j].isspace():
-                    j += 1
-                if current_line[j] == '=':
-                    # this is actually a variable
-                    var_value = ""
-                    j += 1 # skip =
-                    while j < len(current_line):
-                        var_value += current_line[j]
-                        j += 1
-                    # do we have it?
-                    if not varname in config_ac_variables:
-                        config_ac_variables[varname] = {}
-                        config_ac_variables[varname]["value"] = []
-                    # Add it in there
-                    config_ac_variables[varname]["value"].append(var_value)
-
-        # And finally see if this is somethign we can work with
-        method = processable_line(current_line)
-        if method:
-            full_line = ""
-            while True:
-                current_line = content[i].strip()
-                full_line += current_line + " "
-                # now start counting the open parenthesis
-                parco = count_parentheses(full_line)
-                if parco == 0:
-                    # full AC_ARG line
+        m = _VAR_ASSIGN_RE.match(current_line)
+        if m:
+            varname = m.group(1)
+            var_value = m.group(2)
+            # Add it in there
+            config_ac_variables.setdefault(varname, []).append(var_value)
+
+    # second sweep: one regex pass over the whole text finds every macro the script can work with, the span of
+    # each hit is then extended to the balanced closing parenthesis to cover multi-line macros
+    newline_positions = []
+    pos = text.find('\n')
+    while pos != -1:
+        newline_positions.append(pos)
+        pos = text.find('\n', pos + 1)
+
+    for macro in _AC_MACRO_RE.finditer(text):
+        method = macro.group(1)
+        macro_end = find_balanced_end(text, macro.end())
+        full_line = " ".join(part.strip() for part in text[macro.start():macro_end].split('\n')) + " "
+        # for AC_DEFINES we'll keep also the nearest preceding line with a $variable, since that is the one
+        # having the actual variable name. Don't look too far back, funny results will come out of it
+        if method == "AC_DEFINE":
+            line_no = bisect.bisect_left(newline_positions, macro.start())
+            for back in range(line_no - 1, max(line_no - 5, -1), -1):
+                candidate = lines[back].strip()
+                if '$' in candidate:
+                    full_line += candidate
                     break
-                else:
-                    # fetch continuously lines from the content till parco will become 0
-                    i += 1
-            # for AC_DEFINES we'll keep also the "if" line
-            if method == "AC_DEFINE":
-                full_line += previous_line
-            parameters = {'line': full_line}
-            function_list[method](**parameters)
-
-    # now merge the global defines into the global options
+        parameters = {'line': full_line}
+        function_list[method](**parameters)
+
+    # now merge the global defines into the global options. The defines are indexed by their name and by the
+    # option name they came from, so each option finds its define with two lookups instead of a full scan
+    defines_by_name = {}
+    defines_by_optname = {}
+    define_order = {}
+    for i, temp_define in enumerate(temp_defines.values()):
+        defines_by_name[temp_define.name] = temp_define
+        defines_by_optname.setdefault(temp_define.option_name, temp_define)
+        define_order[temp_define.name] = i
+
+    for option in options.values():
+        by_define = defines_by_name.get(option.define)
+        by_optname = defines_by_optname.get(option.name)
+        # when both lookups hit, keep the define that came first, as the scan used to
+        if by_define is None:
+            temp_define = by_optname
+        elif by_optname is None or define_order[by_define.name] <= define_order[by_optname.name]:
+            temp_define = by_define
+        else:
+            temp_define = by_optname
+        if temp_define is None:
+            continue
+        if option.define == temp_define.name:
+            option.define_description = temp_define.description
+            option.define_value = temp_define.value.translate(_BRACKET_DEL)
+            temp_define.used = 1
+        if option.name == temp_define.option_name:
+            option.define = temp_define.name
+            option.define_description = temp_define.description
+            option.define_value = temp_define.value.translate(_BRACKET_DEL)
+            temp_define.used = 1
+
+    # Now let's see which are the temp defines that were not used and match them somehow to various options.
+    # Rather than running the fuzzy match on every (define, option) pair, index the option names by their
+    # character 3-grams and only compare against the options sharing at least one of them
+    by_shingle = {}
     for option_name in options:
-        option = options[option_name]
-        for temp_define_name in temp_defines:
-            temp_define = temp_defines[temp_define_name]
-            enter = False
-            if option.get_define() == temp_define["name"]:
-                option.set_define_description(temp_define["description"])
-                option.set_define_value(temp_define["value"])
-                temp_define["used"] = 1
-                enter = True
-            if option.get_name() == temp_define["option_name"]:
-                option.set_define(temp_define["name"])
-                option.set_define_description(temp_define["description"])
-                option.set_define_value(temp_define["value"])
-                temp_define["used"] = 1
-                enter = True
-            if enter:
-                break
-
-    # Now let's see which are the temp defines that were not used and match them somehow to various options
+        opt_upper = option_name.upper()
+        for i in range(len(opt_upper) - 2):
+            by_shingle.setdefault(opt_upper[i:i + 3], set()).add(option_name)
+
     for temp_define_name in temp_defines:
         temp_define = temp_defines[temp_define_name]
-        if temp_define["used"] == 0:
-            # find an option which is similar to it:
+        if temp_define.used == 0:
+            # find the options which are similar to it:
+            td_upper = temp_define_name.upper()
+            if len(td_upper) > 2:
+                candidates = set()
+                for i in range(len(td_upper) - 2):
+                    candidates.update(by_shingle.get(td_upper[i:i + 3], ()))
+            else:
+                # too short to have any 3-grams, fall back to comparing with everything
+                candidates = options
             for option_name in options:
+                if option_name not in candidates:
+                    continue
                 option = options[option_name]
-                td_upper = temp_define_name
-                td_upper = td_upper.upper()
-                opt_upper = option_name
-                opt_upper= opt_upper.upper()
-                sim_v = similar(td_upper, opt_upper)
-                if (sim_v > 0.5) or (td_upper in opt_upper) or (opt_upper in td_upper):
-                    option.add_extra_define(temp_define_name)
-                    temp_define["used"] = 1
+                opt_upper = option_name.upper()
+                if (td_upper in opt_upper) or (opt_upper in td_upper) or similar(td_upper, opt_upper) > 0.5:
+                    option.extra_defines.append(temp_define_name)
+                    temp_define.used = 1
+
+########################################################################################################################
+# Gathers the source and the header files of a directory in one scandir pass
+########################################################################################################################
+def _classify_sources(d):
+    cpps = []
+    headers = []
+    with os.scandir(d) as it:
+        for entry in it:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            dot = entry.name.rfind(".")
+            if dot < 0:
+                continue
+            ext = entry.name[dot:].lower()
+            if ext in cpp_extensions:
+                cpps.append(entry.name)
+            elif ext in header_extensions:
+                headers.append(entry.name)
+    return cpps, headers
 
 ########################################################################################################################
 # Generates default CMakeLists.txt in the given directory with content of source files
@@ -1054,12 +1237,9 @@ def generate_default_cmake(req_dir):
     sources = "set (project "
     sources += projname
     sources += ")\nset(${project}_SOURCES\n"
-    files = glob.glob(req_dir + "/*.c*")
-    for f in files:
-        sources += "\t${CMAKE_CURRENT_SOURCE_DIR}/" + f.split("/")[-1] + "\n"
-    files = glob.glob(req_dir + "/*.h*")
-    for f in files:
-        sources += "\t${CMAKE_CURRENT_SOURCE_DIR}/" + f.split("/")[-1] + "\n"
+    cpps, headers = _classify_sources(req_dir)
+    for f in cpps + headers:
+        sources += "\t${CMAKE_CURRENT_SOURCE_DIR}/" + f + "\n"
 
     sources += ")\n"
 
@@ -1083,25 +1263,27 @@ def process_cmake_file_directories():
 ########################################################################################################################
 # Will check if the incoming header file is a MOC header or not. Just scan for a Q_OBJECT macro in it
 ########################################################################################################################
+@functools.lru_cache(maxsize=None)
 def moc_header(fn):
-    with open(fn) as search:
-        for line in search:
-            line = line.strip()  # remove '\n' at end of line
-            if "Q_OBJECT" == line:
-                print('  Checking if {} is moc:{}'.format(fn, True))
-                search.close()
-                return True
-    search.close()
-    print('  Checking if {} is moc:{}'.format(fn, False))
-    return False
+    with open(fn, "rb") as search:
+        try:
+            mm = mmap.mmap(search.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            return b"Q_OBJECT" in search.read()
+        try:
+            return mm.find(b"Q_OBJECT") != -1
+        finally:
+            mm.close()
 
 ########################################################################################################################
 # Creates a CMakeLists project file from the given parameters
 ########################################################################################################################
 def create_cmakefile(path, cpps, headers, module):
 
-    # This will return: (bool, bool, bool)
-    # Meaning: first bool: there were cpp files
+    # This will return: (str, bool, bool, bool, str)
+    # Meaning: first: the generated content, for the caller to write out
+    #          first bool: there were cpp files
     #          second bool: there were header files
     #          third bool: if set to process qt style moc headers and there were moc headers: true
 
@@ -1114,45 +1296,40 @@ def create_cmakefile(path, cpps, headers, module):
         full_module = full_module[1:]
         full_module = full_module.replace("/", "_")
 
-    f = open(pjoin(path,"CMakeLists.txt"), "w+")
-
-    f.write("cmake_minimum_required(VERSION 2.8)\n")
+    parts = ["cmake_minimum_required(VERSION 2.8)\n"]
     if full_module:
-        f.write("set (project " + full_module + ")\n\n")
+        parts.append("set (project " + full_module + ")\n\n")
     else:
-        f.write("set (project " + module + ")\n\n")
+        parts.append("set (project " + module + ")\n\n")
         full_module = module
 
     if cpps:
         cpps_found = True
-        f.write("set(${project}_SOURCES\n")
+        parts.append("set(${project}_SOURCES\n")
         for fn in cpps:
-            f.write("    ${CMAKE_CURRENT_SOURCE_DIR}/" + fn + "\n")
-        f.write(")\n\n")
+            parts.append("    ${CMAKE_CURRENT_SOURCE_DIR}/" + fn + "\n")
+        parts.append(")\n\n")
 
     moc_headers = []
 
     if headers:
         headers_found = True
-        f.write("set(${project}_HEADERS\n")
+        parts.append("set(${project}_HEADERS\n")
         for fn in headers:
             if not moc_header(pjoin(path,fn)):
-                f.write("    ${CMAKE_CURRENT_SOURCE_DIR}/" + fn + "\n")
+                parts.append("    ${CMAKE_CURRENT_SOURCE_DIR}/" + fn + "\n")
             else:
                 moc_headers.append(fn)
-        f.write(")\n\n")
+        parts.append(")\n\n")
 
     if moc_headers:
         mocs_found = True
-        f.write("set(${project}_MOC_HEADERS\n")
+        parts.append("set(${project}_MOC_HEADERS\n")
         for fn in moc_headers:
-            f.write("    ${CMAKE_CURRENT_SOURCE_DIR}/" + fn + "\n")
-        f.write(")\n\n")
-
+            parts.append("    ${CMAKE_CURRENT_SOURCE_DIR}/" + fn + "\n")
+        parts.append(")\n\n")
 
-    f.close()
-
-    return cpps_found, headers_found, mocs_found, full_module
+    return "".join(parts), cpps_found, headers_found, mocs_found, full_module
 
 ########################################################################################################################
 # Converts a given directory to a CMake project
@@ -1165,9 +1342,21 @@ def convert_sourcetree_to_cmake(start_path):
         print("Not actually")
         return ""
 
-    modules = []
+    # snapshot the tree in one pruned topdown walk, then process it in reverse. That is a post-order
+    # visit: every directory is handled exactly once and the children are done before their parent
+    walked = []
+    for path, dirs, files in os.walk(start_path, followlinks=False):
+        # prune before os.walk descends, so the version control stores are never even listed
+        dirs[:] = [d for d in dirs if d not in _SKIP_DIRS]
+        walked.append((path, list(dirs), files))
+        if not recursive:
+            break
+
+    # the module names built in each subtree, filled bottom-up
+    modules_of = {}
+    used_module = ""
 
-    for path, dirs, files in os.walk(start_path):
+    for path, dirs, files in reversed(walked):
 
         cpp_files = []
         header_files = []
@@ -1175,73 +1364,68 @@ def convert_sourcetree_to_cmake(start_path):
 
         temp_module = os.path.basename(path)  # directory of file
 
-        if ".git" in temp_module:
-            continue
-
         for filename in files:
-            full_name = os.path.join(path, filename)
-
-            fn, ext = os.path.splitext(full_name)
-            ext = ext.lower()
-            if ext in cpp_extensions:
-                cpp_files.append(filename)
-            if ext in header_extensions:
-                header_files.append(filename)
-            if ext in qrc_extensions:
-                resource_files.append(filename)
+            dot = filename.rfind(".")
+            if dot < 0:
+                continue
+            bucket = _EXT_BUCKET.get(filename[dot:].lower())
+            if bucket is not None:
+                (cpp_files, header_files, resource_files)[bucket].append(filename)
 
-        cpps_found, headers_found, mocs_found, used_module = create_cmakefile(path, cpp_files, header_files, temp_module)
+        content, cpps_found, headers_found, mocs_found, used_module = create_cmakefile(path, cpp_files, header_files, temp_module)
 
-        # Now fix the cmake in the current directory to include the directories
-        f = open(pjoin(path, "CMakeLists.txt"), "a")
+        # the rest of the file is buffered here and everything is written with one open per directory
+        body = [content]
 
+        submodules = []
         if recursive:
             for cdir in dirs:
-                if ".git" in cdir:
-                    continue
-                f.write("add_subdirectory(" + cdir + ")\n")
-                sub_module = convert_sourcetree_to_cmake(pjoin(path, cdir))
-                if sub_module:
-                    modules.append(sub_module)
+                body.append("add_subdirectory(" + cdir + ")\n")
+                submodules.extend(modules_of.get(pjoin(path, cdir), []))
 
         # See the cmake automoc status
         if mocs_found:
             if not cmake_automoc:
-                f.write("qt_wrap_cpp(${project}_MOC_SOURCES ${${project}_MOC_HEADERS})\n")
+                body.append("qt_wrap_cpp(${project}_MOC_SOURCES ${${project}_MOC_HEADERS})\n")
             else:
-                f.write("set(CMAKE_INCLUDE_CURRENT_DIR ON)\n")
-                f.write("set(CMAKE_AUTOMOC ON)\n")
+                body.append("set(CMAKE_INCLUDE_CURRENT_DIR ON)\n")
+                body.append("set(CMAKE_AUTOMOC ON)\n")
 
         if cpps_found or headers_found or mocs_found:
-            f.write("add_library(${project} STATIC ")
+            body.append("add_library(${project} STATIC ")
         if cpps_found:
-            f.write("${${project}_SOURCES} ")
+            body.append("${${project}_SOURCES} ")
         if headers_found:
-            f.write("${${project}_HEADERS} ")
+            body.append("${${project}_HEADERS} ")
 
         if mocs_found:
             if not cmake_automoc:
-                f.write("${${project}_MOC_SOURCES} ")
+                body.append("${${project}_MOC_SOURCES} ")
             else:
-                f.write("${${project}_MOC_HEADERS}")
+                body.append("${${project}_MOC_HEADERS}")
 
         if cpps_found or headers_found or mocs_found:
-            f.write(")\n")
-
-        if modules:
-            f = open(pjoin(start_path, "CMakeLists.txt"), "a")
-
-            f.write("\ntarget_link_libraries (${project}\n")
-
-            for module in modules:
-                if ".git" in module:
-                    continue
-                f.write("    " + module + "\n")
-
-            f.write(")\n")
-
-        if not recursive:
-            exit(0)
+            body.append(")\n")
+
+        f = open(pjoin(path, "CMakeLists.txt"), "w")
+        f.writelines(body)
+        f.close()
+
+        if used_module:
+            submodules.append(used_module)
+        modules_of[path] = submodules
+
+    # the libraries built by the subdirectories link into the CMakeLists of the walk root, added once at the end
+    modules = [m for m in modules_of.get(start_path, []) if m != used_module]
+    if modules:
+        f = open(pjoin(start_path, "CMakeLists.txt"), "a")
+        f.write("\ntarget_link_libraries (${project}\n")
+        for module in modules:
+            if ".git" in module:
+                continue
+            f.write("    " + module + "\n")
+        f.write(")\n")
+        f.close()
 
     return used_module
 
@@ -1249,7 +1433,11 @@ def convert_sourcetree_to_cmake(start_path):
 # Finds a list of files in the given directory
 ########################################################################################################################
 def find_wildcard_file(fn, dir):
-    fs = glob.glob(dir + "/" + fn)
+    fs = []
+    with os.scandir(dir) as it:
+        for entry in it:
+            if entry.is_file(follow_symlinks=False) and fnmatch.fnmatch(entry.name, fn):
+                fs.append(entry.path)
     return fs
 
 ########################################################################################################################
@@ -1469,6 +1657,113 @@ def convert_qmake_project(dir, fn):
     exit(0)
 
 
+########################################################################################################################
+# builds the content of the top level CMakeLists.txt from the gathered options and defines
+########################################################################################################################
+def generate_toplevel_cmake():
+    buf = io.StringIO()
+    if generate_comments:
+        buf.write("# Autogenerated by auto2cmake on {0}\n\n# Options\n\n".
+                         format(time.strftime("%Y-%m-%d %H:%M:%S")))
+
+    # let's not be very cmake hungry
+    buf.write("cmake_minimum_required(VERSION 2.8)\n")
+
+    # decorate-sort-undecorate: the name is fetched once per option and the sort compares plain tuples
+    decorated = sorted(((opt.name, key, opt) for key, opt in options.items()), key=operator.itemgetter(0))
+    sorted_options = [(key, opt) for _, key, opt in decorated]
+    for option in sorted_options:
+        opt = option[1]
+        opt.finalize()
+        name = opt.name
+        description = opt.description
+        if generate_comments:
+            buf.write(f"# Option to {description}\n")
+
+        buf.write(f"option( {name} \"{description}\" {opt.status} )\n")
+        if more_newlines:
+            buf.write("\n")
+
+    # next step: write CMake code that will write the header config.h
+    buf.write(_CONFIG_H_BLOCK_COMMENTED if generate_comments else _CONFIG_H_BLOCK)
+
+    for option in sorted_options:
+        opt = option[1]
+        name = opt.name
+        define = opt.define
+
+        # some non-automata-conforming configure entries (the very verbose ones) do not have option name. Let's guess
+        # them and prepend HAVE_ ... hopefully the programmers will fix them in their CMakeLists files
+        if len(define) >= 1:
+            extra = remove_garbage(opt.define_value)
+            define_line = f"    file(APPEND ${{CONFIG_H}} \"#define {define} {replace_quotes(extra)}\\n\\n\")\n"
+        else:
+            define_line = f"    file(APPEND ${{CONFIG_H}} \"#define HAVE_{name} \\n\\n\")\n"
+
+        buf.write(f"if( {name} )\n"
+                  f"    message(\" {name} Enabled\")\n"
+                  f"    file(APPEND ${{CONFIG_H}} \"/* {remove_garbage(opt.define_description)} */\\n\")\n"
+                  + define_line)
+
+        # now put out the extra defines of the option
+        for extra in opt.extra_defines:
+            extra_value = remove_garbage(extra)
+            buf.write(f"## !!! WARNING {extra_value} Identified with some pattern matching magic.\n"
+                       "## Remove if not relevant!\")\n")
+            buf.write(f"    file(APPEND ${{CONFIG_H}} \"#define {extra_value}\\n\\n\")\n")
+
+        buf.write(f"endif( {name} )\n")
+
+    buf.write("\n")
+    buf.write("## !!! WARNING These are the defines that were defined regardless of an option.\n"
+                     "## !!! Or the script couldn't match them. Match them accordingly, delete them or keep them\n")
+
+    # Now put out all the temp_defines that are still not used
+    for temp_define_name in temp_defines:
+        temp_define = temp_defines[temp_define_name]
+        if temp_define.used == 0:
+            extra_value = remove_garbage(temp_define.value)
+            buf.write(f"file(APPEND ${{CONFIG_H}} \"/* {remove_garbage(temp_define.description)} */\\n\")\n")
+            buf.write(f"file(APPEND ${{CONFIG_H}} \"#define {temp_define_name} {replace_quotes(extra_value)} \\n\\n \")\n")
+
+    # since the config.h went into the ${CMAKE_BINARY_DIR} let's add that to the include directories
+    buf.write(_TOP_TAIL_COMMENTED if generate_comments else _TOP_TAIL)
+
+    return buf.getvalue()
+
+# the most iovec entries one writev call accepts, a file with more fragments is joined and written plainly
+try:
+    _IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):
+    _IOV_MAX = 1024
+
+########################################################################################################################
+# Writes the content of one CMakeFile to disk, handing the fragments of the file to the kernel
+# in one writev call instead of joining them into a single blob first
+########################################################################################################################
+def _emit_cmakefile(cfile, toplevel_content):
+    directory = cfile.directory
+    chunks = [cfile.extra_content.encode()]
+    chunks.extend(c.encode() for c in cfile.contained_libraries_content)
+    if directory == working_directory:
+        chunks.insert(0, toplevel_content.encode())
+    chunks = [c for c in chunks if c]
+    fd = os.open(directory + "/CMakeLists.txt", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    if hasattr(os, "writev") and 0 < len(chunks) <= _IOV_MAX:
+        while chunks:
+            written = os.writev(fd, chunks)
+            # writev may stop short, drop what went out and retry the remainder
+            while chunks and written >= len(chunks[0]):
+                written -= len(chunks[0])
+                del chunks[0]
+            if written:
+                chunks[0] = chunks[0][written:]
+    else:
+        view = memoryview(b"".join(chunks))
+        while view:
+            view = view[os.write(fd, view):]
+    os.close(fd)
+
 ########################################################################################################################
 # converts the solution in the current directory
 ########################################################################################################################
@@ -1489,6 +1784,7 @@ def convert():
     configure_ac = find_file("configure.ac", working_directory)
     if configure_ac:
         process_configure_ac(configure_ac)
+        _save_makefile_am_cache()
     else:
 
         qmake_pro = find_wildcard_file("*.pro", working_directory)
@@ -1505,82 +1801,9 @@ def convert():
         convert_sourcetree_to_cmake(working_directory)
         exit()
 
-    # next step: write the options in a CMakeLists.txt for the gathered data
-    cmake_file = open(working_directory + "/CMakeLists.txt", "w")
-    if generate_comments:
-        cmake_file.write("# Autogenerated by auto2cmake on {0}\n\n# Options\n\n".
-                         format(time.strftime("%Y-%m-%d %H:%M:%S")))
-
-    # let's not be very cmake hungry
-    cmake_file.write("cmake_minimum_required(VERSION 2.8)\n")
-
-    sorted_options = sorted(options.items(), key=lambda x: x[1].get_name(), reverse=False)
-    for option in sorted_options:
-        option[1].finalize()
-        if generate_comments:
-            cmake_file.write("# Option to {0}\n".format(option[1].get_description()))
-
-        cmake_file.write("option( {0} \"{1}\" {2} )\n".format(option[1].get_name(), option[1].get_description(),
-                                                               option[1].get_status()))
-        if more_newlines:
-            cmake_file.write("\n")
-
-    # next step: write CMake code that will write the header config.h
-    if generate_comments:
-        cmake_file.write("# The lines below will generate the config.h based on the options above\n"
-                         "# The file will be in the ${CMAKE_BINARY_DIR} location\n")
-
-    cmake_file.write("set(CONFIG_H ${CMAKE_BINARY_DIR}/config.h)\n")
-    cmake_file.write("string(TIMESTAMP CURRENT_TIMESTAMP)\n")
-    cmake_file.write("file(WRITE ${CONFIG_H} \"/* WARNING: This file is auto-generated by CMake on ${CURRENT_TIMESTAMP}"
-                     ". DO NOT EDIT!!! */\\n\\n\")\n")
-
-    for option in sorted_options:
-        cmake_file.write("if( {0} )\n".format(option[1].get_name()))
-        cmake_file.write("    message(\" {0} Enabled\")\n".format(option[1].get_name()))
-        cmake_file.write("    file(APPEND ${{CONFIG_H}} \"/* {0} */\\n\")\n".format(remove_garbage(option[1].get_define_description())))
-
-        # some non-automata-conforming configure entries (the very verbose ones) do not have option name. Let's guess
-        # them and prepend HAVE_ ... hopefully the programmers will fix them in their CMakeLists files
-        if len(option[1].get_define()) >= 1:
-            extra = remove_garbage(option[1].get_define_value())
-            cmake_file.write("    file(APPEND ${{CONFIG_H}} \"#define {0} {1}\\n\\n\")\n".format(option[1].get_define(), replace_quotes(extra)))
-        else:
-            cmake_file.write("    file(APPEND ${{CONFIG_H}} \"#define HAVE_{0} \\n\\n\")\n".format(option[1].get_name()))
-
-        # now put out the extra defines of the option
-        for extra in option[1].get_extra_defines():
-            extra_value = remove_garbage(extra)
-            cmake_file.write("## !!! WARNING {0} Identified with some pattern matching magic.\n"
-                             "## Remove if not relevant!\")\n".format(extra_value))
-            cmake_file.write("    file(APPEND ${{CONFIG_H}} \"#define {0}\\n\\n\")\n".format(extra_value))
-
-        cmake_file.write("endif( {0} )\n".format(option[1].get_name()))
-
-    cmake_file.write("\n")
-    cmake_file.write("## !!! WARNING These are the defines that were defined regardless of an option.\n"
-                     "## !!! Or the script couldn't match them. Match them accordingly, delete them or keep them\n")
-
-    # Now put out all the temp_defines that are still not used
-    for temp_define_name in temp_defines:
-        temp_define = temp_defines[temp_define_name]
-        if temp_define["used"] == 0:
-            extra_value = remove_garbage(temp_define["value"])
-            cmake_file.write("file(APPEND ${{CONFIG_H}} \"/* {0} */\\n\")\n".format(remove_garbage(temp_define["description"])))
-            cmake_file.write("file(APPEND ${{CONFIG_H}} \"#define {0} {1} \\n\\n \")\n".format(temp_define_name, replace_quotes(extra_value)))
-
-    # since the config.h went into the ${CMAKE_BINARY_DIR} let's add that to the include directories
-    cmake_file.write("\n")
-    if generate_comments:
-        cmake_file.write("# Setting the include directory for the application to find config.h\n")
-    cmake_file.write("include_directories( ${CMAKE_BINARY_DIR} )")
-
-    cmake_file.write("\n")
-    if generate_comments:
-        cmake_file.write("# Since we have created a config.h add a global define for it\n")
-    cmake_file.write("add_definitions( \"-DHAVE_CONFIG_H\" )")
-
-    cmake_file.close()
+    # next step: build the options content. It stays in memory and leaves with the single write below,
+    # so the top level file is not opened once for the options and again for the libraries
+    toplevel_content = generate_toplevel_cmake()
 
     # Done with the top level CMakeLists.txt generated from configure.ac
 
@@ -1590,27 +1813,23 @@ def convert():
     # Now merge together the extra things with the library generated cmake files, create new if necessary
     process_cmake_file_directories()
 
-    # Firstly remove all attempts that were there
-    for cmakefile_name in cmake_files:
-        cfile = cmake_files[cmakefile_name]
-        if os.path.isfile(cfile.directory + "/CMakeLists.txt"):
-            if working_directory != cfile.directory:
-                os.remove(cfile.directory + "/CMakeLists.txt")
-
-    # Now just write the CMakeLists.txt
-    for cmakefile_name in cmake_files:
-        cfile = cmake_files[cmakefile_name]
-        new_cmake_file = open(cfile.directory + "/CMakeLists.txt", "a")
-        if cfile.directory in required_directories:
-            required_directories.remove(cfile.directory)
-        new_cmake_file.write(cfile.extra_content)
-        for content in cfile.contained_libraries_content:
-            new_cmake_file.write(content)
-        new_cmake_file.close()
+    # the top level directory takes part in the write below even if no library ended up in it
+    if working_directory not in cmake_files:
+        cmake_files[working_directory] = CMakeFile(working_directory)
+
+    # Now just write the CMakeLists.txt. The files are independent of each other and the writes
+    # release the GIL, so a thread pool emits them in parallel. The shared set is updated in a
+    # serial pass first to keep the workers free of shared state
+    for cfile in cmake_files.values():
+        required_directories.discard(cfile.directory)
+
+    emit = functools.partial(_emit_cmakefile, toplevel_content = toplevel_content)
+    with ThreadPoolExecutor(max_workers = min(32, (os.cpu_count() or 1) * 4)) as executor:
+        list(executor.map(emit, cmake_files.values()))
 
     # Now see how many required directories did not got their own CMakeLists.txt
     # and generate in there manually, after removing the entries which are in the do not include list
-    final_list = [x for x in required_directories if not should_exclude(x)]
+    final_list = sorted(x for x in required_directories if not should_exclude(x))
 
     warning("WARNING!!! Creating default CMakeLists.txt in the directories below. Don't forget to fix these later")
     for req_dir in final_list:
@@ -1620,15 +1839,23 @@ def convert():
 ########################################################################################################################
 # Prints how to use the application
 ########################################################################################################################
+USAGE = """auto2cmake - a tool to convert autotools/qmake projects to cmake
+
+Usage: auto2cmake.py -d <working_directory> [-e <exclude_directories>] [-q] [-r] [-a] [-h]
+
+Specify exclude_directories: separated by ':'
+
+Other parameters:
+ - q = quick mode, just convert the entire directory into a CMake project file. Ignores both automake
+       and qmake project files in the directory. Will try to identify the usage of QT in the cpp files
+ - r = used in quick mode, do a recursive directory walking
+ - a = used in quick mode/qmake conversion, use CMake automoc set to true instead of manual qt source wrapping
+ - j = number of processes used to render the library CMake content, defaults to 1
+"""
+
+
 def usage():
-    print("auto2cmake - a tool to convert autotools/qmake projects to cmake\n")
-    print("Usage: auto2cmake.py -d <working_directory> [-e <exclude_directories>] [-q] [-r] [-a] [-h]\n")
-    print("Specify exclude_directories: separated by ':'")
-    print("\nOther parameters:")
-    print(" - q = quick mode, just convert the entire directory into a CMake project file. Ignores both automake\n"
-          "       and qmake project files in the directory. Will try to identify the usage of QT in the cpp files")
-    print(" - r = used in quick mode, do a recursive directory walking")
-    print(" - a = used in quick mode/qmake conversion, use CMake automoc set to true instead of manual qt source wrapping")
+    sys.stdout.write(USAGE)
 
 ########################################################################################################################
 # main
@@ -1637,12 +1864,15 @@ def main(argv):
 
     global working_directory
     global exclude_directories
+    global exclude_prefixes
+    global exclude_normalized
     global quick
+    global jobs
     global recursive
     global cmake_automoc
 
     try:
-        opts, args = getopt.getopt(argv, "d:e:hqra", ["directory=,exclude="])
+        opts, args = getopt.getopt(argv, "d:e:hqraj:", ["directory=,exclude="])
     except getopt.GetoptError:
         usage()
         sys.exit(2)
@@ -1662,6 +1892,12 @@ def main(argv):
             recursive = True
         if opt == "-a":
             cmake_automoc = True
+        if opt == "-j":
+            jobs = int(arg)
+
+    normalized_excludes = [os.path.normpath(d) for d in exclude_directories if d]
+    exclude_normalized = frozenset(normalized_excludes)
+    exclude_prefixes = tuple(d + os.sep for d in normalized_excludes)
 
     convert()
 
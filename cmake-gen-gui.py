@@ -1,13 +1,11 @@
 import sys
-from PyQt5.QtWidgets import QApplication, QFileSystemModel, QTreeView, QWidget, QVBoxLayout
-from PyQt5.QtGui import QIcon
 
 
-class App(QWidget):
+class App:
 
-    def __init__(self):
-        super().__init__()
+    __slots__ = ('title', 'left', 'top', 'width', 'height', 'model', 'tree', 'widget')
 
+    def __init__(self):
         self.title = 'cmake-gen-gui'
         self.left = 10
         self.top = 10
@@ -15,16 +13,24 @@ class App(QWidget):
         self.height = 480
         self.model = QFileSystemModel()
         self.tree = QTreeView()
-        self.
+        self.widget = QWidget()
 
         self.initUI()
 
 
     def initUI(self):
-        self.setWindowTitle(self.title)
-
-        self.setGeometry(self.left, self.top, self.width, self.height)
-
+        self.widget.setWindowTitle(self.title)
+
+        self.widget.setGeometry(self.left, self.top, self.width, self.height)
+
+        # the tree only shows the names, so skip the change watching and symlink resolving the
+        # model would otherwise do for every listed entry
+        try:
+            self.model.setOption(QFileSystemModel.DontWatchForChanges, True)
+            self.model.setOption(QFileSystemModel.DontResolveSymlinks, True)
+        except AttributeError:
+            # setOption needs Qt 5.14, older versions still understand this one
+            self.model.setResolveSymlinks(False)
         self.model.setRootPath('.')
 
         self.tree.setModel(self.model)
@@ -33,18 +39,24 @@ class App(QWidget):
         self.tree.setSortingEnabled(True)
         self.tree.setWindowTitle("Dir View")
         self.tree.setColumnWidth(0, 300)
+        # only the name column is used, drop the size/type/date ones
+        for column in (1, 2, 3):
+            self.tree.setColumnHidden(column, True)
 
         windowLayout = QVBoxLayout()
         windowLayout.addWidget(self.tree)
-        self.setLayout(windowLayout)
+        self.widget.setLayout(windowLayout)
 
-        self.show()
+        self.widget.show()
 
 #
 # Main
 #
 
 if __name__ == '__main__':
+    # Qt is imported here so merely importing this module does not pull the whole toolkit in
+    from PyQt5.QtWidgets import QApplication, QFileSystemModel, QTreeView, QWidget, QVBoxLayout
+
     app = QApplication(sys.argv)
     ex = App()
     sys.exit(app.exec_())